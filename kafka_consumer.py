@@ -4,222 +4,631 @@ Simple Kafka Consumer for Testing
 Consumes messages from the user-activity-events topic produced by the Go Ingestion-Service
 """
 
-import json
 import os
 import sys
 import argparse
+import functools
+import queue
+import signal
+import threading
+import time
 from datetime import datetime
 from typing import Dict, Any
 
-from kafka import KafkaConsumer
+from confluent_kafka import Consumer, KafkaException, TopicPartition, TIMESTAMP_NOT_AVAILABLE
 from dotenv import load_dotenv
 
+try:
+    import orjson
+    _loads = orjson.loads
+    _DECODE_ERRORS = orjson.JSONDecodeError
+    
+    def _dumps_line(obj) -> bytes:
+        return orjson.dumps(obj, option=orjson.OPT_APPEND_NEWLINE)
+except ImportError:
+    # orjson has no PyPy wheels; stdlib json is JIT-compiled there and competitive
+    import json
+    _loads = json.loads
+    # json.loads decodes bytes itself and raises UnicodeDecodeError on bad UTF-8,
+    # and TypeError for a None (tombstone) value where orjson raises JSONDecodeError
+    _DECODE_ERRORS = (json.JSONDecodeError, UnicodeDecodeError, TypeError)
+    
+    def _dumps_line(obj) -> bytes:
+        return (json.dumps(obj, ensure_ascii=False, separators=(',', ':')) + '\n').encode('utf-8')
+
 # Load environment variables
 load_dotenv()
 
+# Connection settings, read once at import
+_BROKERS = tuple(os.getenv('KAFKA_BROKERS', 'localhost:9092').split(','))
+_TOPIC = os.getenv('KAFKA_TOPIC', 'user-activity-events')
+_GROUP_ID = os.getenv('KAFKA_GROUP_ID', 'testing-consumer-group')
+
+# Maximum number of messages fetched per consume() call
+BATCH_SIZE = 2000
+# Maximum number of fetched batches waiting for display
+QUEUE_MAX_BATCHES = 8
+# Number of displayed messages buffered before writing to stdout
+FLUSH_EVERY = 100
+# Size of the block buffer stdout is reopened with
+STDOUT_BUFFER_SIZE = 65536
+# Seconds between throughput reports in quiet mode
+STATS_INTERVAL = 5.0
+
+# Display templates, built once at import instead of per message
+_RULE = "=" * 80
+_FOOTER = _RULE + "\n"
+_HEADER_TEMPLATE = (
+    "\n" + _RULE + "\n"
+    "MESSAGE RECEIVED at {received}\n"
+    + _RULE + "\n"
+    "Topic: {topic}\n"
+    "Partition: {partition}\n"
+    "Offset: {offset}\n"
+    "Key: {key}\n"
+)
+_DECODE_ISSUE_TEMPLATE = (
+    "\nMESSAGE DECODE ISSUE:\n"
+    "   {raw_message}\n"
+    + _FOOTER
+)
+_EVENT_HEADING = "\nEVENT DATA:\n" + "-" * 40 + "\n"
+
+# (label, key) pairs for the fixed parts of the EnrichedEvent schema
+_EVENT_FIELDS = (
+    ("Event ID", "event_id"),
+    ("Request ID", "request_id"),
+    ("Event Type", "event_type"),
+    ("User ID", "user_id"),
+    ("Session ID", "session_id"),
+    ("Page URL", "page_url"),
+)
+_CLIENT_INFO_FIELDS = (
+    ("User Agent", "user_agent"),
+    ("Screen Resolution", "screen_resolution"),
+    ("Language", "language"),
+)
+_SERVICE_INFO_FIELDS = (
+    ("Service", "service_name"),
+    ("Version", "service_version"),
+    ("Environment", "environment"),
+)
+# (key, heading, fields) for the nested sections rendered with a template
+_INFO_SECTIONS = (
+    ("client_info", "CLIENT INFO", _CLIENT_INFO_FIELDS),
+    ("service_info", "SERVICE INFO", _SERVICE_INFO_FIELDS),
+)
+
+_EVENT_TEMPLATE = _EVENT_HEADING + "".join(f"{label}: {{{key}}}\n" for label, key in _EVENT_FIELDS)
+_CLIENT_INFO_TEMPLATE = "\nCLIENT INFO:\n" + "".join(f"   {label}: {{{key}}}\n" for label, key in _CLIENT_INFO_FIELDS)
+_SERVICE_INFO_TEMPLATE = "\nSERVICE INFO:\n" + "".join(f"   {label}: {{{key}}}\n" for label, key in _SERVICE_INFO_FIELDS)
+
+# Schema changes tolerated before giving up on generated formatters for the run
+MAX_FORMATTER_COMPILES = 8
+
+# Bound once so per-message formatting skips the module attribute lookup
+_strftime = time.strftime
+_localtime = time.localtime
+
+@functools.lru_cache(maxsize=4096)
+def _format_ts(timestamp_str: str) -> str:
+    """Format an ISO-8601 timestamp for display, cached since bursts share timestamps"""
+    try:
+        # Fast path for 'YYYY-MM-DDTHH:MM:SSZ', the Ingestion-Service's format
+        if len(timestamp_str) == 20 and timestamp_str[10] == 'T' and timestamp_str[19] == 'Z':
+            return f"{timestamp_str[:10]} {timestamp_str[11:19]} UTC"
+        dt = datetime.fromisoformat(timestamp_str.replace('Z', '+00:00'))
+        return dt.strftime('%Y-%m-%d %H:%M:%S UTC')
+    except:
+        return timestamp_str
+
+def _topic_partitions(offsets):
+    """Build the commit list for a {(topic, partition): offset} mapping"""
+    return [TopicPartition(topic, partition, offset) for (topic, partition), offset in offsets.items()]
+
+def _compile_event_formatter(sample):
+    """Generate a formatter for the event body specialised to the shape of sample
+    
+    Fields present in sample are indexed directly and optional parts it lacks are
+    left out, so the generated function raises KeyError for a message of another
+    shape. Returns None if sample can't be specialised.
+    """
+    if not isinstance(sample, dict):
+        return None
+    
+    def field(obj, key, present):
+        return f"{{{obj}[{key!r}]}}" if present else f"{{{obj}.get({key!r}, 'N/A')}}"
+    
+    guards = []
+    parts = [repr(_EVENT_HEADING)]
+    parts += [f'f"{label}: {field("v", key, key in sample)}\\n"' for label, key in _EVENT_FIELDS]
+    
+    if 'timestamp' in sample:
+        parts.append('f"Event Timestamp: {_ts(v[\'timestamp\'])}\\n"')
+    else:
+        guards.append("if 'timestamp' in v: raise KeyError('timestamp')")
+    
+    sections = list(_INFO_SECTIONS)
+    sections.append(("processing_info", "PROCESSING INFO", None))
+    sections.append(("event_data", "EVENT DATA", None))
+    for index, (key, heading, fields) in enumerate(sections):
+        section = sample.get(key)
+        if not section:
+            guards.append(f"if v.get({key!r}): raise KeyError({key!r})")
+            continue
+        if not isinstance(section, dict):
+            return None
+        name = f"s{index}"
+        guards.append(f"{name} = v[{key!r}]")
+        guards.append(f"if not {name}: raise KeyError({key!r})")
+        parts.append(repr(f"\n{heading}:\n"))
+        if key == "processing_info":
+            for label, ts_key in (("Received At", "received_at"), ("Processed At", "processed_at")):
+                if ts_key in section:
+                    parts.append(f'f"   {label}: {{_ts({name}[{ts_key!r}])}}\\n"')
+                else:
+                    guards.append(f"if {ts_key!r} in {name}: raise KeyError({ts_key!r})")
+            parts.append(f'f"   Processing Time: {field(name, "processing_ms", "processing_ms" in section)}ms\\n"')
+        elif key == "event_data":
+            parts.append(f"''.join([f\"   {{k}}: {{x}}\\n\" for k, x in {name}.items()])")
+        else:
+            parts += [f'f"   {label}: {field(name, sub, sub in section)}\\n"' for label, sub in fields]
+    
+    source = "def _fast_format(v, _ts):\n"
+    source += "".join(f"    {line}\n" for line in guards)
+    source += "    return ''.join((\n" + "".join(f"        {part},\n" for part in parts) + "    ))\n"
+    namespace = {}
+    exec(compile(source, "<event-formatter>", "exec"), namespace)
+    return namespace["_fast_format"]
+
+class _DecodeFailure:
+    """Sentinel returned by try_decode_message for payloads that aren't JSON"""
+    __slots__ = ('reason',)
+    
+    def __init__(self, reason):
+        self.reason = reason
+
+# Recognised by class on the hot path instead of inspecting the decoded value
+_INVALID_JSON = _DecodeFailure("Invalid JSON message")
+_NOT_UTF8 = _DecodeFailure("Unable to decode message (not UTF-8)")
+# Only the formatted display needs an object; NDJSON output passes any JSON value through
+_NOT_OBJECT = _DecodeFailure("Not a JSON object")
+
+class _OrNA(dict):
+    """Mapping for str.format_map that renders missing fields as N/A"""
+    def __missing__(self, key):
+        return 'N/A'
+
 class SimpleKafkaConsumer:
-    def __init__(self, read_from_beginning=False):
-        self.brokers = os.getenv('KAFKA_BROKERS', 'localhost:9092').split(',')
-        self.topic = os.getenv('KAFKA_TOPIC', 'user-activity-events')
-        # Use timestamp to create unique consumer group each time
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        self.group_id = os.getenv('KAFKA_GROUP_ID', f'testing-consumer-group-{timestamp}')
+    def __init__(self, read_from_beginning=False, quiet=False, fresh_group=False, ndjson=False):
+        self.brokers = _BROKERS
+        self.topic = _TOPIC
+        # Stable group so committed offsets are reused across runs
+        self.group_id = _GROUP_ID
+        if fresh_group:
+            # Use timestamp to create unique consumer group for this run
+            timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+            self.group_id = f'{self.group_id}-{timestamp}'
         self.read_from_beginning = read_from_beginning
+        self.quiet = quiet
+        self.ndjson = ndjson
         self.consumer = None
+        self._out_buf = []
+        self._queue = queue.Queue(maxsize=QUEUE_MAX_BATCHES)
+        # Cleared by stop(), which may run (from SIGTERM) before consuming starts
+        self._running = True
+        self._fetch_error = None
+        # Next offset to consume per (topic, partition), for the final commit
+        self._offsets = {}
+        # Held while a batch is displayed and committed, so a rebalance can't interleave
+        self._lock = threading.Lock()
+        # Bumped on every revocation; maps each generation to the partitions revoked by it
+        self._generation = 0
+        self._revoked = {}
+        # Event formatter generated from the first message's shape
+        self._fast_format = None
+        self._formatter_compiles = 0
         
     def connect(self):
         """Connect to Kafka and subscribe to the topic"""
         try:
-            print(f"Connecting to Kafka brokers: {self.brokers}")
-            print(f"Subscribing to topic: {self.topic}")
-            print(f"Consumer group: {self.group_id}")
+            self.log(f"Connecting to Kafka brokers: {list(self.brokers)}")
+            self.log(f"Subscribing to topic: {self.topic}")
+            self.log(f"Consumer group: {self.group_id}")
             
             # Set offset reset based on parameter
             offset_reset = 'earliest' if self.read_from_beginning else 'latest'
-            print(f"Offset reset: {offset_reset}")
-            print("-" * 60)
+            self.log(f"Offset reset: {offset_reset}")
+            self.log("-" * 60)
             
-            # Try to create consumer with snappy support first
-            try:
-                self.consumer = KafkaConsumer(
-                    self.topic,
-                    bootstrap_servers=self.brokers,
-                    group_id=self.group_id,
-                    auto_offset_reset=offset_reset,  # Use parameter
-                    enable_auto_commit=True,
-                    value_deserializer=lambda m: json.loads(m.decode('utf-8')),
-                    key_deserializer=lambda m: m.decode('utf-8') if m else None
-                )
-            except Exception as e:
-                if "snappy" in str(e).lower():
-                    print("Snappy compression detected but not supported. Installing snappy support...")
-                    print("Please install snappy support: pip install python-snappy")
-                    print("Trying alternative approach...")
-                    
-                    # Try without compression handling
-                    self.consumer = KafkaConsumer(
-                        self.topic,
-                        bootstrap_servers=self.brokers,
-                        group_id=self.group_id,
-                        auto_offset_reset=offset_reset,  # Use parameter
-                        enable_auto_commit=True,
-                        # Use raw bytes deserializer to handle compression
-                        value_deserializer=lambda m: self.try_decode_message(m),
-                        key_deserializer=lambda m: m.decode('utf-8') if m else None
-                    )
-                else:
-                    raise e
+            # librdkafka handles snappy/lz4/zstd decompression natively
+            self.consumer = Consumer({
+                'bootstrap.servers': ','.join(self.brokers),
+                'group.id': self.group_id,
+                'auto.offset.reset': offset_reset,  # Use parameter
+                # Offsets are committed per displayed batch (see commit_offsets)
+                'enable.auto.commit': False,
+                # Fetch in large batches: a higher fetch.min.bytes and fetch.wait.max.ms
+                # add up to 50ms of latency but cut broker round-trips under load
+                'fetch.min.bytes': 1_048_576,
+                'fetch.wait.max.ms': 50,
+                'max.partition.fetch.bytes': 10_485_760,
+                'socket.receive.buffer.bytes': 4_194_304,
+            })
+            self.consumer.subscribe([self.topic], on_revoke=self._on_revoke)
             
-            print("Successfully connected to Kafka!")
+            self.log("Successfully connected to Kafka!")
             return True
             
         except Exception as e:
-            print(f"Failed to connect to Kafka: {e}")
-            print("Make sure:")
-            print("   1. Kafka is running on localhost:9092")
-            print("   2. The topic 'user-activity-events' exists")
-            print("   3. For Snappy compression: pip install python-snappy")
+            self.log(f"Failed to connect to Kafka: {e}")
+            self.log("Make sure:")
+            self.log("   1. Kafka is running on localhost:9092")
+            self.log("   2. The topic 'user-activity-events' exists")
             return False
     
+    def log(self, *args):
+        """Print a status line; in --ndjson mode it goes to stderr so stdout carries only records"""
+        print(*args, file=sys.stderr if self.ndjson else sys.stdout)
+    
     def try_decode_message(self, message_bytes):
         """Try to decode message with different approaches"""
         try:
             # Try direct JSON decode first
-            return json.loads(message_bytes.decode('utf-8'))
-        except UnicodeDecodeError:
-            try:
-                # Try to handle potential compression
-                print("Message appears to be compressed. Installing python-snappy may help.")
-                return {"raw_message": "Compressed message - install python-snappy for full support"}
-            except Exception:
-                return {"raw_message": "Unable to decode message"}
-        except json.JSONDecodeError:
-            return {"raw_message": "Invalid JSON message"}
+            return _loads(message_bytes)
+        except _DECODE_ERRORS:
+            # librdkafka has already decompressed the payload, so invalid
+            # UTF-8 here means the producer sent non-JSON bytes
+            if message_bytes is not None:
+                try:
+                    message_bytes.decode('utf-8')
+                except UnicodeDecodeError:
+                    return _NOT_UTF8
+            return _INVALID_JSON
     
     def format_timestamp(self, timestamp_str: str) -> str:
         """Format timestamp for display"""
         try:
-            dt = datetime.fromisoformat(timestamp_str.replace('Z', '+00:00'))
-            return dt.strftime('%Y-%m-%d %H:%M:%S UTC')
-        except:
+            return _format_ts(timestamp_str)
+        except TypeError:
+            # Unhashable values can't go through the cache
             return timestamp_str
     
-    def display_message(self, message):
-        """Display a received message in a formatted way"""
-        print("\n" + "="*80)
-        print(f"MESSAGE RECEIVED at {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
-        print("="*80)
+    # Module globals are bound as defaults so the per-message path uses fast local lookups
+    def display_message(self, message, value, _strftime=_strftime, _localtime=_localtime,
+                        _header=_HEADER_TEMPLATE.format, _decode_issue=_DECODE_ISSUE_TEMPLATE.format,
+                        _failure=_DecodeFailure, _not_object=_NOT_OBJECT, _dict=dict, _footer=_FOOTER,
+                        _no_timestamp=TIMESTAMP_NOT_AVAILABLE):
+        """Format a received message into the output buffer (see flush_output)"""
+        write = self._out_buf.append
+        key = message.key()
+        timestamp_type, timestamp = message.timestamp()
+        write(_header(
+            received=_strftime('%Y-%m-%d %H:%M:%S'),
+            topic=message.topic(),
+            partition=message.partition(),
+            offset=message.offset(),
+            key=key.decode('utf-8', 'replace') if key else None,
+        ))
+        if timestamp_type != _no_timestamp:
+            write(f"Timestamp: {_strftime('%Y-%m-%d %H:%M:%S', _localtime(timestamp // 1000))}\n")
         
-        # Message metadata
-        print(f"Topic: {message.topic}")
-        print(f"Partition: {message.partition}")
-        print(f"Offset: {message.offset}")
-        print(f"Key: {message.key}")
-        print(f"Timestamp: {datetime.fromtimestamp(message.timestamp/1000).strftime('%Y-%m-%d %H:%M:%S')}")
-        
-        # Message value (the actual event data)
-        value = message.value
-        
-        # Check if it's a raw message (compression issue)
-        if isinstance(value, dict) and "raw_message" in value:
-            print(f"\nMESSAGE DECODE ISSUE:")
-            print(f"   {value['raw_message']}")
-            print(f"   Install python-snappy: pip install python-snappy")
-            print("="*80)
+        # Check if it's a raw message (decode issue), or JSON that isn't an event object
+        if value.__class__ is not _dict:
+            write(_decode_issue(raw_message=(value if value.__class__ is _failure else _not_object).reason))
             return
         
-        print("\nEVENT DATA:")
-        print("-" * 40)
+        text = None
+        fast_format = self._fast_format
+        if fast_format is not None:
+            try:
+                text = fast_format(value, self.format_timestamp)
+            except (KeyError, TypeError, AttributeError):
+                pass
+        if text is None:
+            # First message or a new shape: format generically and respecialise
+            text = self.format_event(value)
+            if self._formatter_compiles < MAX_FORMATTER_COMPILES:
+                self._fast_format = _compile_event_formatter(value)
+                self._formatter_compiles += 1
+            else:
+                # Shapes keep changing; stop paying for a fast path that misses
+                self._fast_format = None
+        write(text)
+        write(_footer)
+    
+    def format_event(self, value, _or_na=_OrNA, _event=_EVENT_TEMPLATE.format_map,
+                     _client_info=_CLIENT_INFO_TEMPLATE.format_map,
+                     _service_info=_SERVICE_INFO_TEMPLATE.format_map):
+        """Format the event body of a decoded message"""
+        parts = []
+        write = parts.append
+        format_timestamp = self.format_timestamp
         
         # Display basic event info
-        print(f"Event ID: {value.get('event_id', 'N/A')}")
-        print(f"Request ID: {value.get('request_id', 'N/A')}")
-        print(f"Event Type: {value.get('event_type', 'N/A')}")
-        print(f"User ID: {value.get('user_id', 'N/A')}")
-        print(f"Session ID: {value.get('session_id', 'N/A')}")
-        print(f"Page URL: {value.get('page_url', 'N/A')}")
+        write(_event(_or_na(value)))
         
         # Timestamps
         if 'timestamp' in value:
-            print(f"Event Timestamp: {self.format_timestamp(value['timestamp'])}")
+            write(f"Event Timestamp: {format_timestamp(value['timestamp'])}\n")
         
         # Client Info
-        client_info = value.get('client_info', {})
+        client_info = value.get('client_info')
         if client_info:
-            print(f"\nCLIENT INFO:")
-            print(f"   User Agent: {client_info.get('user_agent', 'N/A')}")
-            print(f"   Screen Resolution: {client_info.get('screen_resolution', 'N/A')}")
-            print(f"   Language: {client_info.get('language', 'N/A')}")
+            write(_client_info(_or_na(client_info)))
         
         # Service Info
-        service_info = value.get('service_info', {})
+        service_info = value.get('service_info')
         if service_info:
-            print(f"\nSERVICE INFO:")
-            print(f"   Service: {service_info.get('service_name', 'N/A')}")
-            print(f"   Version: {service_info.get('service_version', 'N/A')}")
-            print(f"   Environment: {service_info.get('environment', 'N/A')}")
+            write(_service_info(_or_na(service_info)))
         
         # Processing Info
-        processing_info = value.get('processing_info', {})
+        processing_info = value.get('processing_info')
         if processing_info:
-            print(f"\nPROCESSING INFO:")
+            write("\nPROCESSING INFO:\n")
             if 'received_at' in processing_info:
-                print(f"   Received At: {self.format_timestamp(processing_info['received_at'])}")
+                write(f"   Received At: {format_timestamp(processing_info['received_at'])}\n")
             if 'processed_at' in processing_info:
-                print(f"   Processed At: {self.format_timestamp(processing_info['processed_at'])}")
-            print(f"   Processing Time: {processing_info.get('processing_ms', 'N/A')}ms")
+                write(f"   Processed At: {format_timestamp(processing_info['processed_at'])}\n")
+            write(f"   Processing Time: {processing_info.get('processing_ms', 'N/A')}ms\n")
         
         # Event Data (custom data)
-        event_data = value.get('event_data', {})
+        event_data = value.get('event_data')
         if event_data:
-            print(f"\nEVENT DATA:")
-            for key, val in event_data.items():
-                print(f"   {key}: {val}")
+            write("\nEVENT DATA:\n")
+            write(''.join([f"   {key}: {val}\n" for key, val in event_data.items()]))
         
-        print("="*80)
+        return ''.join(parts)
+    
+    def display_ndjson(self, message, value):
+        """Buffer a received message as one NDJSON line (see flush_output)"""
+        key = message.key()
+        if value.__class__ is _DecodeFailure:
+            value = {'raw_message': value.reason}
+        self._out_buf.append(_dumps_line({
+            'k': key.decode('utf-8', 'replace') if key else None,
+            'p': message.partition(),
+            'o': message.offset(),
+            'v': value,
+        }))
+    
+    def buffer_error(self, error):
+        """Buffer a consumer error in the current output format"""
+        if self.ndjson:
+            self._out_buf.append(_dumps_line({'error': str(error)}))
+        else:
+            self._out_buf.append(f"Consumer error: {error}\n")
+    
+    def flush_output(self):
+        """Write buffered display output to stdout in a single call"""
+        if self._out_buf:
+            if self.ndjson:
+                # NDJSON lines are already bytes; write them straight to fd 1
+                sys.stdout.flush()
+                data = memoryview(b''.join(self._out_buf))
+                while data:
+                    data = data[os.write(1, data):]
+            else:
+                sys.stdout.write(''.join(self._out_buf))
+            self._out_buf.clear()
+        # Also pushes out status prints, since stdout is block-buffered (see main)
+        sys.stdout.flush()
     
     def consume_messages(self):
         """Start consuming messages"""
         if not self.consumer:
-            print("Consumer not initialized. Call connect() first.")
+            self.log("Consumer not initialized. Call connect() first.")
             return
         
-        print("Starting to consume messages...")
-        print("Send some events to the Ingestion-Service to see them here!")
-        print("Press Ctrl+C to stop\n")
+        if not self._running:
+            # stop() was requested while connecting
+            self.close()
+            return
+        
+        self.log("Starting to consume messages...")
+        self.log("Send some events to the Ingestion-Service to see them here!")
+        self.log("Press Ctrl+C to stop\n")
+        sys.stdout.flush()
+        
+        fetcher = threading.Thread(target=self._fetch_loop, name="kafka-fetch", daemon=True)
+        fetcher.start()
         
         try:
-            for message in self.consumer:
-                self.display_message(message)
+            # Bind hot callables to locals once, outside the loop
+            get_batch = self._queue.get
+            display = self.display_ndjson if self.ndjson else self.display_message
+            decode = self.try_decode_message
+            flush = self.flush_output
+            out_buf = self._out_buf
+            loads = _loads
+            quiet = self.quiet
+            
+            count = 0
+            pending = 0
+            started = last_report = time.monotonic()
+            
+            while self._running:
+                try:
+                    generation, messages = get_batch(timeout=1.0)
+                except queue.Empty:
+                    if self._fetch_error:
+                        raise self._fetch_error
+                    generation, messages = self._generation, ()
+                
+                with self._lock:
+                    if self._revoked:
+                        self._prune_revoked(generation)
+                    if generation != self._generation:
+                        # Fetched before a rebalance: skip partitions we no longer own
+                        messages = self._drop_revoked(generation, messages)
+                    
+                    for message in messages:
+                        if message.error():
+                            self.buffer_error(message.error())
+                            continue
+                        count += 1
+                        if quiet:
+                            continue
+                        # Fast path: most messages are valid JSON. A full parse beats
+                        # lazy per-field simdjson lookups since display reads nearly every field
+                        try:
+                            value = loads(message.value())
+                        except _DECODE_ERRORS:
+                            value = decode(message.value())
+                        # A message that can't be displayed must not stop the consumer:
+                        # its batch would never be committed and would replay on restart
+                        mark = len(out_buf)
+                        try:
+                            display(message, value)
+                        except Exception as e:
+                            del out_buf[mark:]
+                            self.buffer_error(
+                                f"Unable to display message at {message.topic()}"
+                                f"[{message.partition()}]@{message.offset()}: {e}"
+                            )
+                        pending += 1
+                        if pending >= FLUSH_EVERY:
+                            flush()
+                            pending = 0
                 
+                    # Flush the remainder of the batch; get() returns at least once per timeout
+                    flush()
+                    pending = 0
+                
+                    if messages:
+                        self.commit_offsets(messages)
+                
+                if quiet:
+                    now = time.monotonic()
+                    if now - last_report >= STATS_INTERVAL:
+                        elapsed = now - started
+                        self.log(f"Consumed {count} messages in {elapsed:.1f}s (rate = {count / elapsed:.1f} msg/s)")
+                        last_report = now
+            
+            self.log("\nStopping consumer...")
         except KeyboardInterrupt:
-            print("\nStopping consumer...")
+            self.log("\nStopping consumer...")
         except Exception as e:
-            print(f"Error consuming messages: {e}")
+            self.log(f"Error consuming messages: {e}")
         finally:
+            self._running = False
+            fetcher.join()
+            try:
+                self.flush_output()
+            except OSError:
+                # stdout is gone (e.g. piped into head); point it at /dev/null so
+                # close() and interpreter shutdown can still write
+                devnull = os.open(os.devnull, os.O_WRONLY)
+                os.dup2(devnull, sys.stdout.fileno())
+                os.close(devnull)
             self.close()
     
+    def commit_offsets(self, messages):
+        """Asynchronously commit the offsets following a processed batch"""
+        offsets = {(m.topic(), m.partition()): m.offset() + 1 for m in messages if not m.error()}
+        if offsets:
+            self._offsets.update(offsets)
+            self.consumer.commit(offsets=_topic_partitions(offsets), asynchronous=True)
+    
+    def _on_revoke(self, consumer, partitions):
+        """Rebalance callback: commit and forget partitions this member is losing"""
+        revoked = {(tp.topic, tp.partition) for tp in partitions}
+        with self._lock:
+            # Still the owner at this point, so make processed offsets durable first
+            offsets = {tp: offset for tp, offset in self._offsets.items() if tp in revoked}
+            if offsets:
+                try:
+                    consumer.commit(offsets=_topic_partitions(offsets), asynchronous=False)
+                except KafkaException as e:
+                    self.log(f"Failed to commit offsets for revoked partitions: {e}")
+            for tp in revoked:
+                self._offsets.pop(tp, None)
+            self._generation += 1
+            self._revoked[self._generation] = revoked
+    
+    def _prune_revoked(self, generation):
+        """Forget revocations no queued batch can still be older than"""
+        # The queue is FIFO, so every later batch was fetched at this generation or newer
+        for g in [g for g in self._revoked if g <= generation]:
+            del self._revoked[g]
+    
+    def _drop_revoked(self, generation, messages):
+        """Filter out messages from partitions revoked since the batch was fetched"""
+        revoked = set().union(*(self._revoked.get(g, ()) for g in range(generation + 1, self._generation + 1)))
+        return [m for m in messages if (m.topic(), m.partition()) not in revoked]
+    
+    def stop(self):
+        """Ask consume_messages to finish its current batch and shut down"""
+        self._running = False
+    
+    def _fetch_loop(self):
+        """Fetch message batches from Kafka and hand them to the display thread"""
+        consume = self.consumer.consume
+        put = self._queue.put
+        try:
+            while self._running:
+                messages = consume(num_messages=BATCH_SIZE, timeout=1.0)
+                if not messages:
+                    continue
+                # Block while the queue is full so a slow display applies backpressure
+                while self._running:
+                    try:
+                        put((self._generation, messages), timeout=1.0)
+                        break
+                    except queue.Full:
+                        pass
+        except Exception as e:
+            # Surfaced by consume_messages once the queue has drained
+            self._fetch_error = e
+    
     def close(self):
         """Close the consumer connection"""
         if self.consumer:
+            if self._offsets:
+                # Commit synchronously so the last processed batch is durable, but
+                # only for partitions still assigned so another member isn't rewound
+                try:
+                    assigned = {(tp.topic, tp.partition) for tp in self.consumer.assignment()}
+                    offsets = {tp: offset for tp, offset in self._offsets.items() if tp in assigned}
+                    if offsets:
+                        self.consumer.commit(offsets=_topic_partitions(offsets), asynchronous=False)
+                except KafkaException as e:
+                    self.log(f"Failed to commit final offsets: {e}")
             self.consumer.close()
-            print("Consumer connection closed.")
+            self.log("Consumer connection closed.")
 
 def main():
     """Main function"""
-    print("Simple Kafka Consumer for Testing")
-    print("=" * 50)
+    # Block-buffer stdout so output isn't flushed line by line; flush_output()
+    # flushes once per batch
+    sys.stdout.flush()
+    sys.stdout = os.fdopen(sys.stdout.fileno(), 'w', buffering=STDOUT_BUFFER_SIZE,
+                           encoding=sys.stdout.encoding, closefd=False)
     
     parser = argparse.ArgumentParser(description="Control whether to read from beginning or latest")
     parser.add_argument("--read-from-beginning", action="store_true", help="Read messages from the beginning of the topic")
+    parser.add_argument("--quiet", "--count-only", action="store_true", help="Only count messages and periodically report the consume rate")
+    parser.add_argument("--ndjson", action="store_true", help="Write each message as a JSON line instead of the formatted display")
+    parser.add_argument("--fresh-group", action="store_true", help="Use a new timestamped consumer group instead of resuming the configured one")
     args = parser.parse_args()
     
-    consumer = SimpleKafkaConsumer(read_from_beginning=args.read_from_beginning)
+    consumer = SimpleKafkaConsumer(
+        read_from_beginning=args.read_from_beginning,
+        quiet=args.quiet,
+        fresh_group=args.fresh_group,
+        ndjson=args.ndjson,
+    )
+    
+    consumer.log("Simple Kafka Consumer for Testing")
+    consumer.log("=" * 50)
+    
+    # Shut down cleanly when the container runtime sends SIGTERM
+    signal.signal(signal.SIGTERM, lambda signum, frame: consumer.stop())
     
     if consumer.connect():
         consumer.consume_messages()
     else:
-        print("Failed to start consumer. Exiting.")
+        consumer.log("Failed to start consumer. Exiting.")
         sys.exit(1)
 
 if __name__ == "__main__":